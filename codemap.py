@@ -12,47 +12,114 @@ Usage:
     codemap                           # Map current directory
     codemap /path/to/project          # Map specific project
     codemap --format json             # JSON output
+    codemap --format json --compact   # Unindented JSON
     codemap --depth 3                 # Limit tree depth
     codemap --include-private         # Include _private functions
     codemap --token-budget 4000       # Fit within token limit
+    codemap --no-cache                # Re-parse everything (skip the API cache)
+    codemap --jobs 1                  # Parse in a single process
 """
 
 from __future__ import annotations
 
 import argparse
 import ast
+import hashlib
+import io
 import os
 import re
+import stat
 import subprocess
 import sys
 import textwrap
-from collections import defaultdict
-from dataclasses import dataclass, field
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass, field, replace
+from functools import lru_cache
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterator
 import json
 
 
 # ── Constants ────────────────────────────────────────────────────────────────
 
-SKIP_DIRS = {
+SKIP_DIRS = frozenset({
     ".git", "__pycache__", "node_modules", ".venv", "venv",
     ".tox", ".eggs", "dist", "build", ".mypy_cache", ".pytest_cache",
     ".ruff_cache", "egg-info", ".idea", ".vscode",
-}
+})
 
-SKIP_FILES = {
+SKIP_FILES = frozenset({
     "package-lock.json", "yarn.lock", "poetry.lock", "Pipfile.lock",
     "pnpm-lock.yaml", "uv.lock",
+})
+
+_EXT_LANGUAGES = {
+    ".py": "Python", ".js": "JavaScript", ".ts": "TypeScript",
+    ".jsx": "React", ".tsx": "React/TS", ".rs": "Rust",
+    ".go": "Go", ".rb": "Ruby", ".java": "Java",
+    ".c": "C", ".cpp": "C++", ".h": "C/C++ Header",
+    ".sh": "Shell", ".bash": "Bash", ".zsh": "Zsh",
+    ".sql": "SQL", ".html": "HTML", ".css": "CSS",
+    ".yaml": "YAML", ".yml": "YAML", ".toml": "TOML",
+    ".json": "JSON", ".md": "Markdown", ".rst": "reStructuredText",
+    ".dockerfile": "Dockerfile", ".tf": "Terraform",
 }
 
+# Languages recognised by (lowercased) file name rather than extension
+_NAME_LANGUAGES = {"dockerfile": "Dockerfile", "makefile": "Makefile"}
+
+_ENTRYPOINT_NAMES = frozenset({
+    "main.py", "app.py", "cli.py", "server.py", "manage.py",
+    "index.js", "index.ts", "main.go", "main.rs",
+})
+
+# `if __name__ == "__main__":` (either operand order, either quote style)
+_MAIN_GUARD = r"""__name__\s*==\s*(['"])__main__\1|(['"])__main__\2\s*==\s*__name__"""
+_MAIN_GUARD_RE = re.compile(_MAIN_GUARD)
+_MAIN_GUARD_BYTES_RE = re.compile(_MAIN_GUARD.encode())
+
+# Common test file patterns and test directory names
+_TEST_FILE_RE = re.compile(
+    r'^test_|_test\.(?:py|js)$|\.(?:test|spec)\.[jt]s$|^tests?\.py$')
+_TEST_DIRS = frozenset({'test', 'tests', '__tests__', 'spec', 'specs'})
+
+# Modules left out of the dependency summary
+_STDLIB_MODULES = frozenset({
+    "os", "sys", "re", "json", "csv", "ast", "math", "hashlib",
+    "pathlib", "datetime", "collections", "typing", "dataclasses",
+    "argparse", "textwrap", "subprocess", "unittest", "functools",
+    "itertools", "io", "abc", "enum", "copy", "shutil", "glob",
+    "tempfile", "logging", "warnings", "http", "urllib", "socket",
+    "ssl", "email", "html", "xml", "sqlite3", "threading",
+    "multiprocessing", "asyncio", "concurrent", "contextlib",
+    "inspect", "dis", "importlib", "pkgutil", "struct", "time",
+})
+
+# Line breaks as the parser counts them (for mapping AST line numbers)
+_NEWLINE_RE = re.compile(r'\r\n|\r|\n')
+
+# Cheap pre-check before parsing: any line starting a def/class statement
+# (a bare \r ends a line too, but MULTILINE's ^ only follows \n)
+_HAS_DEF_RE = re.compile(r'(?:^|\r)[ \t\f]*(?:async[ \t]+def|def|class)[ \t]',
+                         re.MULTILINE)
+
+# Bytes of a non-Python file decoded when looking for its description
+_DESCRIPTION_PREFIX = 4096
+
 # Rough token estimation: ~4 chars per token
 CHARS_PER_TOKEN = 4
 
 
 # ── Data Models ──────────────────────────────────────────────────────────────
 
-@dataclass
+# __slots__ instead of a per-instance __dict__ where dataclasses support it
+_SLOTS: dict[str, Any] = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_SLOTS)
 class FileEntry:
     path: str
     rel_path: str
@@ -62,9 +129,18 @@ class FileEntry:
     language: str = ""
     is_entrypoint: bool = False
     importance: float = 0.0  # 0-1, higher = more important
+    mtime_ns: int = 0
+    source: str | None = field(default=None, repr=False, compare=False)  # cached .py text
+    # Derived from rel_path once, reused by scoring and tree rendering
+    parts: tuple[str, ...] = field(init=False, repr=False, compare=False)
+    depth: int = field(init=False, repr=False, compare=False)
 
+    def __post_init__(self) -> None:
+        self.parts = tuple(self.rel_path.split(os.sep))
+        self.depth = len(self.parts) - 1
 
-@dataclass
+
+@dataclass(**_SLOTS)
 class FunctionSig:
     name: str
     params: str
@@ -75,7 +151,7 @@ class FunctionSig:
     class_name: str = ""
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class ClassSig:
     name: str
     bases: list[str] = field(default_factory=list)
@@ -84,7 +160,7 @@ class ClassSig:
     init_params: str = ""
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class ModuleAPI:
     path: str
     docstring: str = ""
@@ -97,158 +173,375 @@ class ModuleAPI:
 # ── File Discovery ───────────────────────────────────────────────────────────
 
 def _detect_language(filepath: str) -> str:
-    ext_map = {
-        ".py": "Python", ".js": "JavaScript", ".ts": "TypeScript",
-        ".jsx": "React", ".tsx": "React/TS", ".rs": "Rust",
-        ".go": "Go", ".rb": "Ruby", ".java": "Java",
-        ".c": "C", ".cpp": "C++", ".h": "C/C++ Header",
-        ".sh": "Shell", ".bash": "Bash", ".zsh": "Zsh",
-        ".sql": "SQL", ".html": "HTML", ".css": "CSS",
-        ".yaml": "YAML", ".yml": "YAML", ".toml": "TOML",
-        ".json": "JSON", ".md": "Markdown", ".rst": "reStructuredText",
-        ".dockerfile": "Dockerfile", ".tf": "Terraform",
-    }
-    name = os.path.basename(filepath).lower()
-    if name == "dockerfile":
-        return "Dockerfile"
-    if name == "makefile":
-        return "Makefile"
+    return _language_for_name(os.path.basename(filepath).lower())
+
+
+@lru_cache(maxsize=4096)
+def _language_for_name(name: str) -> str:
+    """Language for a lowercased file name (names like __init__.py repeat a lot)."""
+    special = _NAME_LANGUAGES.get(name)
+    if special:
+        return special
     _, ext = os.path.splitext(name)
-    return ext_map.get(ext, "")
+    return _EXT_LANGUAGES.get(ext, "")
 
 
-def _is_entrypoint(filepath: str, content: str = "") -> bool:
-    name = os.path.basename(filepath).lower()
-    if name in ("main.py", "app.py", "cli.py", "server.py", "manage.py",
-                "index.js", "index.ts", "main.go", "main.rs"):
-        return True
-    if name.endswith(".py") and content and '__name__' in content and '__main__' in content:
+def _is_entrypoint(filepath: str, content: str | bytes = "") -> bool:
+    return _is_entrypoint_name(os.path.basename(filepath).lower(), content)
+
+
+def _is_entrypoint_name(name: str, content: str | bytes = "") -> bool:
+    """Entrypoint check for a lowercased file name.
+
+    ``content`` may be the raw bytes, so callers need not decode first.
+    """
+    if name in _ENTRYPOINT_NAMES:
         return True
-    return False
+    if not content or not name.endswith(".py"):
+        return False
+    pattern = _MAIN_GUARD_BYTES_RE if isinstance(content, bytes) else _MAIN_GUARD_RE
+    return pattern.search(content) is not None
 
 
-def _get_description(filepath: str) -> str:
-    """Extract first-line description from a file."""
+def _get_description(filepath: str, content: str | None = None) -> str:
+    """Extract first-line description from a file (or its already-read content)."""
+    if content is not None:
+        return _description_from_lines(io.StringIO(content, newline=None)) or ""
     try:
         with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#!'):
-                    continue
-                # Python docstring
-                if line.startswith('"""') or line.startswith("'''"):
-                    doc = line.strip('"\' ')
-                    if doc:
-                        return doc[:120]
-                    # Multi-line docstring
-                    for next_line in f:
-                        next_line = next_line.strip()
-                        if next_line:
-                            return next_line.strip('"\' ')[:120]
-                    break
-                # Comment
-                if line.startswith('#'):
-                    return line.lstrip('# ')[:120]
-                if line.startswith('//'):
-                    return line.lstrip('/ ')[:120]
-                break
+            return _description_from_lines(f) or ""
     except (OSError, UnicodeDecodeError):
-        pass
-    return ""
+        return ""
+
+
+def _description_from_bytes(raw: bytes) -> str:
+    """Description from raw file content, decoding only its opening lines."""
+    if len(raw) > _DESCRIPTION_PREFIX:
+        # Cut at a line break so no line (or UTF-8 sequence) is split
+        end = raw.rfind(b'\n', 0, _DESCRIPTION_PREFIX) + 1
+        if end:
+            head = raw[:end].decode('utf-8', errors='replace')
+            desc = _description_from_lines(io.StringIO(head, newline=None))
+            if desc is not None:
+                return desc
+    return _get_description("", raw.decode('utf-8', errors='replace'))
+
+
+def _description_from_lines(f: Iterator[str]) -> str | None:
+    """Description from the opening lines, or None if they run out first."""
+    for line in f:
+        line = line.strip()
+        if not line or line.startswith('#!'):
+            continue
+        # Python docstring
+        if line.startswith('"""') or line.startswith("'''"):
+            doc = line.strip('"\' ')
+            if doc:
+                return doc[:120]
+            # Multi-line docstring
+            for next_line in f:
+                next_line = next_line.strip()
+                if next_line:
+                    return next_line.strip('"\' ')[:120]
+            return None
+        # Comment
+        if line.startswith('#'):
+            return line.lstrip('# ')[:120]
+        if line.startswith('//'):
+            return line.lstrip('/ ')[:120]
+        return ""
+    return None
 
 
 def _is_test_file(filepath: str) -> bool:
     """Check if a file is a test file based on naming conventions."""
-    basename = os.path.basename(filepath)
-    dirname = os.path.basename(os.path.dirname(filepath))
-    
-    # Common test file patterns
-    test_patterns = [
-        basename.startswith('test_'),
-        basename.endswith('_test.py'),
-        basename.endswith('_test.js'),
-        basename.endswith('.test.js'),
-        basename.endswith('.test.ts'),
-        basename.endswith('.spec.js'),
-        basename.endswith('.spec.ts'),
-        basename == 'test.py',
-        basename == 'tests.py',
-    ]
-    
-    # Common test directory names
-    test_dirs = {'test', 'tests', '__tests__', 'spec', 'specs'}
-    
-    return any(test_patterns) or dirname in test_dirs
+    return _is_test_name(os.path.basename(filepath),
+                         os.path.basename(os.path.dirname(filepath)))
+
+
+def _is_test_name(basename: str, dirname: str) -> bool:
+    """Test-file check from a file name and its parent directory's name."""
+    return dirname in _TEST_DIRS or _TEST_FILE_RE.search(basename) is not None
+
+
+def _count_lines(data: bytes) -> int:
+    """Count lines like iterating a file does (a trailing partial line counts)."""
+    lines = data.count(b'\n')  # memchr in C, no per-line objects
+    if data and not data.endswith(b'\n'):
+        lines += 1
+    return lines
+
+
+def _process_file(filepath: str, rel: str, name: str, size: int,
+                  mtime_ns: int = 0) -> FileEntry:
+    """Read a single file (``name`` is its basename) and build its entry."""
+    # One read serves line counting, description, entrypoint detection
+    # and API extraction
+    raw = b""
+    if size:
+        try:
+            with open(filepath, 'rb') as f:
+                raw = f.read()
+        except OSError:
+            pass
+    lines = _count_lines(raw)
+
+    name_lower = name.lower()
+    lang = _language_for_name(name_lower)
+    is_py = name.endswith('.py')
+    content = raw.decode('utf-8', errors='replace') if is_py else None
+    if not lang:
+        desc = ""
+    elif content is not None:
+        desc = _get_description(filepath, content)
+    else:
+        desc = _description_from_bytes(raw)
+
+    return FileEntry(
+        path=filepath,
+        rel_path=rel,
+        size=size,
+        lines=lines,
+        mtime_ns=mtime_ns,
+        description=desc,
+        language=lang,
+        is_entrypoint=_is_entrypoint_name(name_lower, raw),
+        source=content,
+    )
 
 
 def discover_files(root: str, max_depth: int = 10, exclude_tests: bool = False) -> list[FileEntry]:
-    """Discover project files, excluding noise."""
-    entries: list[FileEntry] = []
+    """Discover project files, excluding noise (and anything git ignores)."""
     root = os.path.abspath(root)
+    files = _git_list_files(root, max_depth, exclude_tests)
+    if files is None:
+        files = _walk_files(root, max_depth, exclude_tests)
+
+    # Per-file work is I/O-bound, so overlap it across threads
+    workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda f: _process_file(*f), files))
+
+
+def _git_list_files(root: str, max_depth: int, exclude_tests: bool,
+                    timeout: float = 30) -> list[tuple[str, str, str, int, int]] | None:
+    """Candidate files from the git index, or None if git can't vouch for root.
+
+    Tracked plus untracked-but-not-ignored files, so .gitignore is honoured
+    without walking ignored directories. The same skip rules as the
+    directory walk are applied on top. None (walk instead) when root isn't
+    in a work tree, or is itself ignored by an enclosing repository (e.g. a
+    checkout under node_modules/ or a dotfiles repo ignoring ``*``).
+    """
+    try:
+        proc = subprocess.run(
+            ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, cwd=root,
+            timeout=timeout,
+        )
+        if proc.returncode != 0 or not proc.stdout:
+            return None
+        ignored = subprocess.run(
+            ["git", "check-ignore", "-q", "."],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=root,
+            timeout=timeout,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if ignored.returncode == 0:
+        return None
 
-    for dirpath, dirnames, filenames in os.walk(root):
-        # Skip hidden/build directories
-        dirnames[:] = [d for d in dirnames
-                       if d not in SKIP_DIRS and not d.startswith('.')]
+    files: list[tuple[str, str, str, int, int]] = []
+    sep = os.sep
+    root_name = os.path.basename(root)
+    seen = set()  # paths both staged and modified are listed twice
+    for path in proc.stdout.decode('utf-8', errors='surrogateescape').split('\0'):
+        if not path or path in seen:
+            continue
+        seen.add(path)
+        parts = path.split('/')
+        name = parts[-1]
+        # An empty name is a nested repository ("sub/"), listed as a directory
+        if (not name or len(parts) - 1 > max_depth or name[0] == '.'
+                or name in SKIP_FILES):
+            continue
+        dirs = parts[:-1]
+        if any(d[0] == '.' or d in SKIP_DIRS for d in dirs):
+            continue
+        if exclude_tests and _is_test_name(name, dirs[-1] if dirs else root_name):
+            continue
 
-        depth = dirpath[len(root):].count(os.sep)
-        if depth > max_depth:
-            dirnames.clear()
+        rel = path if sep == '/' else sep.join(parts)
+        full = root + sep + rel
+        # Deleted-but-tracked files and submodules (directories) drop out here
+        try:
+            st = os.stat(full)
+        except OSError:
+            continue
+        if not stat.S_ISREG(st.st_mode) or st.st_size > 1_000_000:
+            continue
+        files.append((full, rel, name, st.st_size, st.st_mtime_ns))
+    return files
+
+
+def _walk_files(root: str, max_depth: int,
+                exclude_tests: bool) -> list[tuple[str, str, str, int, int]]:
+    """Candidate files from walking the directory tree."""
+    files: list[tuple[str, str, str, int, int]] = []
+    sep = os.sep
+
+    # Iterative depth-first walk. Each stack item carries the directory's
+    # name, depth and root-relative prefix (with a trailing separator), so
+    # relative paths are built by concatenation instead of os.path calls.
+    stack: list[tuple[str, str, str, int]] = (
+        [(root, os.path.basename(root), "", 0)] if max_depth >= 0 else [])
+    while stack:
+        dirpath, dirname, rel_dir, depth = stack.pop()
+        try:
+            with os.scandir(dirpath) as it:
+                dir_entries = list(it)
+        except OSError:
             continue
 
-        for fname in sorted(filenames):
-            if fname in SKIP_FILES or fname.startswith('.'):
+        subdirs = []
+        file_entries = []
+        for entry in dir_entries:
+            name = entry.name
+            # Hidden files and directories are skipped alike, before any
+            # type check
+            if name[0] == '.':
                 continue
-            filepath = os.path.join(dirpath, fname)
-            
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                # Prune build directories and symlinked dirs before they
+                # are ever listed
+                if (depth < max_depth and name not in SKIP_DIRS
+                        and not entry.is_symlink()):
+                    subdirs.append((entry.path, name, rel_dir + name + sep, depth + 1))
+            elif name not in SKIP_FILES:
+                file_entries.append(entry)
+
+        for entry in sorted(file_entries, key=lambda e: e.name):
             # Skip test files if requested
-            if exclude_tests and _is_test_file(filepath):
+            if exclude_tests and _is_test_name(entry.name, dirname):
                 continue
-            
-            rel = os.path.relpath(filepath, root)
 
+            # DirEntry caches its stat result, so no separate os.stat call
             try:
-                stat = os.stat(filepath)
-                size = stat.st_size
+                st = entry.stat()
             except OSError:
                 continue
+            size = st.st_size
 
             # Skip large binary files
             if size > 1_000_000:  # 1MB
                 continue
 
-            lang = _detect_language(filepath)
-            desc = _get_description(filepath) if lang else ""
-
-            try:
-                with open(filepath, 'rb') as f:
-                    lines = sum(1 for _ in f)
-            except OSError:
-                lines = 0
-
-            content = ""
-            if filepath.endswith('.py'):
-                try:
-                    content = Path(filepath).read_text(encoding='utf-8', errors='replace')
-                except OSError:
-                    pass
+            files.append((entry.path, rel_dir + entry.name, entry.name,
+                          size, st.st_mtime_ns))
 
-            entries.append(FileEntry(
-                path=filepath,
-                rel_path=rel,
-                size=size,
-                lines=lines,
-                description=desc,
-                language=lang,
-                is_entrypoint=_is_entrypoint(filepath, content),
-            ))
+        # Reversed so directories are visited in listing order
+        stack.extend(reversed(subdirs))
 
-    return entries
+    return files
 
 
 # ── Python API Extraction ────────────────────────────────────────────────────
 
-def _format_params(args: ast.arguments) -> str:
+def _unparse(node: ast.AST) -> str:
+    """Render an annotation/default/decorator node back to source."""
+    text = _simple_unparse(node)
+    return text if text is not None else ast.unparse(node)
+
+
+def _simple_unparse(node: ast.AST) -> str | None:
+    """Render the common annotation shapes without building an Unparser.
+
+    Handles names, dotted names, subscripts, simple constants and ``X | Y``
+    unions; returns None for anything else so the caller can fall back to
+    ast.unparse.
+    """
+    node_type = type(node)
+    if node_type is ast.Name:
+        return node.id
+    if node_type is ast.Attribute:
+        if type(node.value) is not ast.Name and type(node.value) is not ast.Attribute:
+            return None
+        base = _simple_unparse(node.value)
+        return None if base is None else f"{base}.{node.attr}"
+    if node_type is ast.Subscript:
+        value_type = type(node.value)
+        if value_type not in (ast.Name, ast.Attribute, ast.Subscript):
+            return None
+        base = _simple_unparse(node.value)
+        index = node.slice
+        if type(index) is ast.Tuple:
+            if not index.elts:
+                return None
+            parts = [_simple_unparse(elt) for elt in index.elts]
+            if None in parts:
+                return None
+            inner = ", ".join(parts) if len(parts) > 1 else f"{parts[0]},"
+        else:
+            inner = _simple_unparse(index)
+        if base is None or inner is None:
+            return None
+        return f"{base}[{inner}]"
+    if node_type is ast.Constant:
+        value = node.value
+        if value is None or value is True or value is False or value is ...:
+            return "..." if value is ... else str(value)
+        if type(value) is int:
+            return str(value)
+        if (type(value) is str and node.kind is None and value.isprintable()
+                and not any(c in value for c in "'\"\\")):
+            return f"'{value}'"
+        return None
+    if (node_type is ast.BinOp and type(node.op) is ast.BitOr
+            and type(node.right) is not ast.BinOp):
+        left = _simple_unparse(node.left)
+        right = _simple_unparse(node.right)
+        if left is None or right is None:
+            return None
+        return f"{left} | {right}"
+    return None
+
+
+def _source_renderer(source: str) -> Callable[[ast.AST], str]:
+    """Build a renderer that copies single-line nodes straight from ``source``.
+
+    AST nodes carry their exact position, so slicing the original text is
+    much cheaper than regenerating it with ast.unparse. Nodes spanning
+    several lines (or without positions) still go through _unparse so
+    signatures stay on one line.
+    """
+    line_starts = [0]
+    line_starts.extend(m.end() for m in _NEWLINE_RE.finditer(source))
+
+    def render(node: ast.AST) -> str:
+        if type(node) is ast.Name:
+            return node.id
+        lineno = getattr(node, 'lineno', None)
+        if lineno is None or lineno != getattr(node, 'end_lineno', None):
+            return _unparse(node)
+        try:
+            start = line_starts[lineno - 1]
+            line = source[start:line_starts[lineno]] if lineno < len(line_starts) else source[start:]
+            # Column offsets count UTF-8 bytes
+            if line.isascii():
+                return line[node.col_offset:node.end_col_offset]
+            return line.encode('utf-8')[node.col_offset:node.end_col_offset].decode('utf-8')
+        except (IndexError, UnicodeError):
+            return _unparse(node)
+
+    return render
+
+
+def _format_params(args: ast.arguments,
+                   render: Callable[[ast.AST], str] = _unparse) -> str:
     """Format function parameters as a concise string."""
     parts = []
     defaults_offset = len(args.args) - len(args.defaults)
@@ -259,13 +552,13 @@ def _format_params(args: ast.arguments) -> str:
         s = arg.arg
         if arg.annotation:
             try:
-                s += f": {ast.unparse(arg.annotation)}"
+                s += f": {render(arg.annotation)}"
             except (AttributeError, ValueError):
                 pass
         default_idx = i - defaults_offset
         if default_idx >= 0 and default_idx < len(args.defaults):
             try:
-                s += f" = {ast.unparse(args.defaults[default_idx])}"
+                s += f" = {render(args.defaults[default_idx])}"
             except (AttributeError, ValueError):
                 s += " = ..."
         parts.append(s)
@@ -276,7 +569,7 @@ def _format_params(args: ast.arguments) -> str:
         s = arg.arg
         if arg.annotation:
             try:
-                s += f": {ast.unparse(arg.annotation)}"
+                s += f": {render(arg.annotation)}"
             except (AttributeError, ValueError):
                 pass
         parts.append(s)
@@ -286,123 +579,361 @@ def _format_params(args: ast.arguments) -> str:
     return ", ".join(parts)
 
 
-def _first_docstring_line(node: ast.AST) -> str:
+def _first_docstring_line(node: ast.Module | ast.ClassDef | ast.FunctionDef
+                          | ast.AsyncFunctionDef) -> str:
     """Get first line of docstring."""
-    if (hasattr(node, 'body') and node.body
-            and isinstance(node.body[0], ast.Expr)
-            and isinstance(node.body[0].value, ast.Constant)
-            and isinstance(node.body[0].value.value, str)):
-        doc = node.body[0].value.value.strip()
-        first_line = doc.split('\n')[0].strip()
-        return first_line[:120]
-    return ""
+    doc = ast.get_docstring(node, clean=False)
+    if not doc:
+        return ""
+    return doc.strip().partition('\n')[0].strip()[:120]
 
 
 def extract_python_api(filepath: str, include_private: bool = False) -> ModuleAPI | None:
     """Extract public API from a Python file."""
     try:
         source = Path(filepath).read_text(encoding='utf-8', errors='replace')
+    except OSError:
+        return None
+    return extract_python_api_from_source(source, filepath, include_private)
+
+
+def extract_python_api_from_source(source: str, filepath: str,
+                                   include_private: bool = False) -> ModuleAPI | None:
+    """Extract public API from already-read Python source."""
+    try:
         tree = ast.parse(source, filename=filepath)
-    except (SyntaxError, OSError):
+    except (SyntaxError, ValueError):
         return None
 
     rel = os.path.basename(filepath)
     api = ModuleAPI(path=rel, docstring=_first_docstring_line(tree))
 
-    # Check for __all__
-    for node in ast.iter_child_nodes(tree):
-        if isinstance(node, ast.Assign):
-            for target in node.targets:
-                if isinstance(target, ast.Name) and target.id == '__all__':
-                    if isinstance(node.value, (ast.List, ast.Tuple)):
-                        for elt in node.value.elts:
-                            if isinstance(elt, ast.Constant) and isinstance(elt.value, str):
-                                api.exports.append(elt.value)
-
-    # Imports (just module names for the dep graph)
-    for node in ast.iter_child_nodes(tree):
-        if isinstance(node, ast.Import):
-            for alias in node.names:
-                api.imports.append(alias.name.split('.')[0])
-        elif isinstance(node, ast.ImportFrom):
-            if node.module and not node.module.startswith('.'):
-                api.imports.append(node.module.split('.')[0])
+    # Single pass over top-level statements, dispatched on node type
+    render = _source_renderer(source)
+    handlers_get = _NODE_HANDLERS.get
+    for node in tree.body:
+        handler = handlers_get(type(node))
+        if handler:
+            handler(node, api, include_private, render)
+
     api.imports = sorted(set(api.imports))
+    return api
 
-    # Functions
-    for node in ast.iter_child_nodes(tree):
-        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-            if not include_private and node.name.startswith('_'):
-                continue
-            returns = ""
-            if node.returns:
-                try:
-                    returns = ast.unparse(node.returns)
-                except (AttributeError, ValueError):
-                    pass
-            decorators = []
-            for dec in node.decorator_list:
-                try:
-                    decorators.append(ast.unparse(dec))
-                except (AttributeError, ValueError):
-                    pass
-
-            api.functions.append(FunctionSig(
-                name=node.name,
-                params=_format_params(node.args),
-                returns=returns,
-                docstring=_first_docstring_line(node),
-                is_async=isinstance(node, ast.AsyncFunctionDef),
-                decorators=decorators,
-            ))
-
-    # Classes
-    for node in ast.iter_child_nodes(tree):
-        if isinstance(node, ast.ClassDef):
-            if not include_private and node.name.startswith('_'):
+
+def _function_sig(node: ast.FunctionDef | ast.AsyncFunctionDef,
+                  render: Callable[[ast.AST], str], class_name: str = "") -> FunctionSig:
+    returns = ""
+    if node.returns:
+        try:
+            returns = render(node.returns)
+        except (AttributeError, ValueError):
+            pass
+    decorators = []
+    if not class_name:  # only module-level functions record decorators
+        for dec in node.decorator_list:
+            try:
+                decorators.append(render(dec))
+            except (AttributeError, ValueError):
+                pass
+
+    return FunctionSig(
+        name=node.name,
+        params=_format_params(node.args, render),
+        returns=returns,
+        docstring=_first_docstring_line(node),
+        is_async=type(node) is ast.AsyncFunctionDef,
+        decorators=decorators,
+        class_name=class_name,
+    )
+
+
+def _handle_assign(node: ast.Assign, api: ModuleAPI, include_private: bool,
+                   render: Callable[[ast.AST], str]) -> None:
+    # __all__ is a plain single-target `__all__ = [...]` / `(...)`
+    if len(node.targets) != 1:
+        return
+    target = node.targets[0]
+    if type(target) is not ast.Name or target.id != '__all__':
+        return
+    value = node.value
+    if type(value) is ast.List or type(value) is ast.Tuple:
+        api.exports.extend(elt.value for elt in value.elts
+                           if type(elt) is ast.Constant and type(elt.value) is str)
+
+
+def _handle_import(node: ast.Import, api: ModuleAPI, include_private: bool,
+                   render: Callable[[ast.AST], str]) -> None:
+    # Just module names for the dep graph
+    for alias in node.names:
+        api.imports.append(alias.name.split('.')[0])
+
+
+def _handle_importfrom(node: ast.ImportFrom, api: ModuleAPI, include_private: bool,
+                       render: Callable[[ast.AST], str]) -> None:
+    if node.module and not node.module.startswith('.'):
+        api.imports.append(node.module.split('.')[0])
+
+
+def _handle_func(node: ast.FunctionDef | ast.AsyncFunctionDef, api: ModuleAPI,
+                 include_private: bool, render: Callable[[ast.AST], str]) -> None:
+    if not include_private and node.name.startswith('_'):
+        return
+    api.functions.append(_function_sig(node, render))
+
+
+def _handle_class(node: ast.ClassDef, api: ModuleAPI, include_private: bool,
+                  render: Callable[[ast.AST], str]) -> None:
+    if not include_private and node.name.startswith('_'):
+        return
+    bases = []
+    for base in node.bases:
+        try:
+            bases.append(render(base))
+        except (AttributeError, ValueError):
+            pass
+
+    cls = ClassSig(
+        name=node.name,
+        bases=bases,
+        docstring=_first_docstring_line(node),
+    )
+
+    # Class bodies can be long; keep the per-child checks on locals
+    function_def, async_function_def = ast.FunctionDef, ast.AsyncFunctionDef
+    add_method = cls.methods.append
+    class_name = node.name
+    for child in node.body:
+        child_type = type(child)
+        if child_type is not function_def and child_type is not async_function_def:
+            continue
+        if child.name == '__init__':
+            cls.init_params = _format_params(child.args, render)
+        elif include_private or not child.name.startswith('_'):
+            add_method(_function_sig(child, render, class_name=class_name))
+
+    api.classes.append(cls)
+
+
+_NODE_HANDLERS: dict[type, Callable[..., None]] = {
+    ast.FunctionDef: _handle_func,
+    ast.AsyncFunctionDef: _handle_func,
+    ast.ClassDef: _handle_class,
+    ast.Assign: _handle_assign,
+    ast.Import: _handle_import,
+    ast.ImportFrom: _handle_importfrom,
+}
+
+
+def _extract_one(args: tuple[str, str | None, bool]) -> ModuleAPI | None:
+    """Extract one file's API (module-level so worker processes can run it)."""
+    filepath, source, include_private = args
+    if source is None:
+        return extract_python_api(filepath, include_private=include_private)
+    return extract_python_api_from_source(source, filepath, include_private=include_private)
+
+
+# Parsed modules keyed on (path, mtime_ns, size, include_private), so repeated
+# cached generate_map/generate_json calls in one process don't re-parse
+_api_memo: dict[tuple[str, int, int, bool], ModuleAPI | None] = {}
+_API_MEMO_MAX = 8192
+
+# Files to parse per worker process below which a pool isn't worth starting
+_MIN_FILES_PER_WORKER = 32
+
+# ProcessPoolExecutor rejects more workers than this on Windows
+_MAX_WINDOWS_WORKERS = 61
+
+
+def _extract_apis(entries: list[FileEntry], include_private: bool = False,
+                  cache_path: str | None = None, jobs: int | None = None) -> list[ModuleAPI]:
+    """Extract APIs for all Python entries, preserving entry order.
+
+    Modules without functions or classes are left out. With ``cache_path``,
+    files parsed earlier (in this process, or in earlier runs via the
+    on-disk cache, which is then rewritten) are reused while their mtime and
+    size are unchanged; without it every file is parsed afresh. ``jobs``
+    caps the worker processes used for parsing (default: CPU count; 1
+    parses in this process).
+    """
+    # Files that can't contain a def/class have nothing to index: skip the parse
+    py_entries = [e for e in entries if e.rel_path.endswith('.py')
+                  and (e.source is None or _HAS_DEF_RE.search(e.source))]
+
+    cached = _load_api_cache(cache_path) if cache_path else {}
+    results: list[ModuleAPI | None] = []
+    to_parse: list[int] = []
+    for i, entry in enumerate(py_entries):
+        memo_key = (entry.path, entry.mtime_ns, entry.size, include_private)
+        if cache_path and entry.mtime_ns and memo_key in _api_memo:
+            results.append(_api_memo[memo_key])
+            continue
+        # Without an mtime (entries built by hand) there's nothing to validate against
+        hit = entry.mtime_ns and cached.get(_api_cache_key(entry.path, include_private))
+        if hit and hit["mtime_ns"] == entry.mtime_ns and hit["size"] == entry.size:
+            results.append(_module_api_from_dict(hit["api"]) if hit["api"] else None)
+        else:
+            results.append(None)
+            to_parse.append(i)
+
+    args = [(py_entries[i].path, py_entries[i].source, include_private) for i in to_parse]
+    parsed: list[ModuleAPI | None] | None = None
+    # Parsing is CPU-bound; fan out across processes unless pool startup
+    # would cost more than it saves. Each worker must get enough files to
+    # pay for its own startup, and a few chunks each to even out the load.
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if sys.platform == "win32":
+        jobs = min(jobs, _MAX_WINDOWS_WORKERS)
+    workers = min(jobs, len(args) // _MIN_FILES_PER_WORKER)
+    if workers > 1:
+        chunksize = max(1, len(args) // (workers * 4))
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                parsed = list(executor.map(_extract_one, args, chunksize=chunksize))
+        except (OSError, NotImplementedError, BrokenProcessPool):
+            parsed = None
+    if parsed is None:
+        parsed = [_extract_one(a) for a in args]
+    for i, api in zip(to_parse, parsed):
+        results[i] = api
+
+    if cache_path:
+        # Entries for files no longer present drop out; the other
+        # include_private variant of files still present is kept
+        live = {entry.path for entry in py_entries}
+        files = {key: hit for key, hit in cached.items()
+                 if key.partition(":")[2] in live}
+        stale = len(files) != len(cached)
+        for entry, api in zip(py_entries, results):
+            if not entry.mtime_ns:
                 continue
-            bases = []
-            for base in node.bases:
-                try:
-                    bases.append(ast.unparse(base))
-                except (AttributeError, ValueError):
-                    pass
-
-            cls = ClassSig(
-                name=node.name,
-                bases=bases,
-                docstring=_first_docstring_line(node),
-            )
-
-            for child in node.body:
-                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                    if child.name == '__init__':
-                        cls.init_params = _format_params(child.args)
-                    elif not include_private and child.name.startswith('_'):
-                        continue
-                    else:
-                        returns = ""
-                        if child.returns:
-                            try:
-                                returns = ast.unparse(child.returns)
-                            except (AttributeError, ValueError):
-                                pass
-                        cls.methods.append(FunctionSig(
-                            name=child.name,
-                            params=_format_params(child.args),
-                            returns=returns,
-                            docstring=_first_docstring_line(child),
-                            is_async=isinstance(child, ast.AsyncFunctionDef),
-                            class_name=node.name,
-                        ))
-
-            api.classes.append(cls)
+            files[_api_cache_key(entry.path, include_private)] = {
+                "mtime_ns": entry.mtime_ns,
+                "size": entry.size,
+                "api": asdict(api) if api else None,
+            }
+        if to_parse or stale or len(files) != len(cached):
+            _save_api_cache(cache_path, files)
+
+    if cache_path and len(_api_memo) + len(py_entries) > _API_MEMO_MAX:
+        _api_memo.clear()
+    apis: list[ModuleAPI] = []
+    for entry, api in zip(py_entries, results):
+        if cache_path and entry.mtime_ns:
+            _api_memo[(entry.path, entry.mtime_ns, entry.size, include_private)] = api
+        if api and (api.functions or api.classes):
+            # Copy so memoized results keep their own path
+            apis.append(replace(api, path=entry.rel_path))
+    return apis
+
+
+def _clear_caches() -> None:
+    """Forget in-process memoized results (e.g. between tests)."""
+    _api_memo.clear()
+
+
+# ── API Cache ────────────────────────────────────────────────────────────────
+
+# Bump whenever extraction output changes so stale cached APIs are ignored
+_API_CACHE_VERSION = 3
 
-    return api
+
+def _api_cache_path(root: str) -> str:
+    """Per-project cache file under $XDG_CACHE_HOME (default ~/.cache)."""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache")
+    digest = hashlib.sha1(os.path.abspath(root).encode("utf-8", "replace")).hexdigest()
+    return os.path.join(cache_home, "codemap", f"{digest[:16]}.json")
+
+
+def _api_cache_key(filepath: str, include_private: bool) -> str:
+    return f"{int(include_private)}:{filepath}"
+
+
+def _load_api_cache(cache_path: str) -> dict[str, Any]:
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != _API_CACHE_VERSION:
+        return {}
+    return data.get("files", {})
+
+
+def _save_api_cache(cache_path: str, files: dict[str, Any]) -> None:
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": _API_CACHE_VERSION, "files": files}, f,
+                      separators=(",", ":"))
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def _module_api_from_dict(data: dict[str, Any]) -> ModuleAPI:
+    return ModuleAPI(
+        path=data["path"],
+        docstring=data["docstring"],
+        functions=[FunctionSig(**f) for f in data["functions"]],
+        classes=[
+            ClassSig(**{**c, "methods": [FunctionSig(**m) for m in c["methods"]]})
+            for c in data["classes"]
+        ],
+        imports=data["imports"],
+        exports=data["exports"],
+    )
 
 
 # ── Importance Scoring ───────────────────────────────────────────────────────
 
+def _git_churn(root: str, timeout: float = 30) -> Counter[str]:
+    """Count commits touching each file in the last 90 days (empty if unavailable)."""
+    try:
+        proc = subprocess.Popen(
+            ["git", "log", "-z", "--pretty=format:", "--name-only", "--since=90 days ago"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, cwd=root,
+        )
+    except OSError:
+        return Counter()
+
+    # Stream the (potentially huge) log instead of buffering it; the timer
+    # bounds the whole read, not just the final wait
+    counts: Counter[bytes] = Counter()
+    timer = threading.Timer(timeout, proc.kill)
+    timer.start()
+    try:
+        pending = b""
+        for chunk in iter(lambda: proc.stdout.read(65536), b""):
+            names = (pending + chunk).split(b"\0")
+            pending = names.pop()
+            counts.update(names)
+        counts[pending] += 1
+        proc.stdout.close()
+        proc.wait()
+    finally:
+        # Join so no thread outlives the call (a process pool may fork next)
+        timer.cancel()
+        timer.join()
+
+    if proc.returncode != 0:
+        return Counter()
+    del counts[b""]
+    return Counter({name.decode('utf-8', errors='replace'): n for name, n in counts.items()})
+
+
+# Importance bonus by language: source code > config > docs
+_LANGUAGE_WEIGHTS = {
+    "Python": 0.2, "JavaScript": 0.2, "TypeScript": 0.2, "Rust": 0.2, "Go": 0.2,
+    "Makefile": 0.1, "Dockerfile": 0.1, "Shell": 0.1,
+}
+
+
 def _score_importance(entries: list[FileEntry], root: str) -> None:
     """Score file importance based on heuristics."""
     if not entries:
@@ -411,150 +942,157 @@ def _score_importance(entries: list[FileEntry], root: str) -> None:
     max_lines = max(e.lines for e in entries) or 1
 
     # Git churn (if available)
-    churn: dict[str, int] = {}
-    try:
-        result = subprocess.run(
-            ["git", "log", "--pretty=format:", "--name-only", "--since=90 days ago"],
-            capture_output=True, text=True, cwd=root, timeout=30
-        )
-        if result.stdout:
-            for line in result.stdout.split('\n'):
-                line = line.strip()
-                if line:
-                    churn[line] = churn.get(line, 0) + 1
-    except (subprocess.TimeoutExpired, FileNotFoundError, OSError):
-        pass
-
+    churn = _git_churn(root)
     max_churn = max(churn.values()) if churn else 1
+    churn_get = churn.get
+    language_weight = _LANGUAGE_WEIGHTS.get
 
     for entry in entries:
-        score = 0.0
-
         # Entrypoints are important
-        if entry.is_entrypoint:
-            score += 0.3
+        score = 0.3 if entry.is_entrypoint else 0.0
 
-        # Source code > config > docs
-        if entry.language in ("Python", "JavaScript", "TypeScript", "Rust", "Go"):
-            score += 0.2
-        elif entry.language in ("Makefile", "Dockerfile", "Shell"):
-            score += 0.1
+        score += language_weight(entry.language, 0.0)
 
         # Size matters (larger files have more API surface)
         score += (entry.lines / max_lines) * 0.2
 
         # Git churn (frequently changed = important)
-        if entry.rel_path in churn:
-            score += (churn[entry.rel_path] / max_churn) * 0.2
+        changes = churn_get(entry.rel_path)
+        if changes:
+            score += (changes / max_churn) * 0.2
 
         # Root-level files are more important
-        depth = entry.rel_path.count(os.sep)
-        if depth == 0:
+        if entry.depth == 0:
             score += 0.1
 
         # Has description = documented = important
         if entry.description:
             score += 0.05
 
-        entry.importance = min(1.0, score)
+        entry.importance = score if score < 1.0 else 1.0
 
 
 # ── Output Formatters ────────────────────────────────────────────────────────
 
-def _format_tree(entries: list[FileEntry], max_depth: int = 10) -> str:
-    """Format file tree with descriptions."""
-    lines = []
-    tree: dict[str, Any] = {}
+def _format_tree(entries: list[FileEntry], max_depth: int = 10,
+                 max_chars: int | None = None) -> tuple[str, bool]:
+    """Format file tree with descriptions.
 
+    With ``max_chars``, stops adding lines once the text reaches that
+    length; the flag returned alongside the text says whether it did.
+    """
+    # Sorted paths keep every directory's contents contiguous, so the tree
+    # can be emitted in one linear pass without building nested dicts.
+    rows = []
     for entry in sorted(entries, key=lambda e: e.rel_path):
-        parts = entry.rel_path.split(os.sep)
-        if len(parts) > max_depth + 1:
-            continue
-        node = tree
-        for part in parts[:-1]:
-            if part not in node:
-                node[part] = {}
-            node = node[part]
-        node[parts[-1]] = entry
-
-    def _render(node: dict, prefix: str = "", depth: int = 0):
-        items = list(node.items())
-        for i, (name, val) in enumerate(items):
-            is_last = i == len(items) - 1
-            connector = "└── " if is_last else "├── "
-            extension = "    " if is_last else "│   "
-
-            if isinstance(val, FileEntry):
-                desc = f"  — {val.description}" if val.description else ""
-                star = "★ " if val.is_entrypoint else ""
-                lines.append(f"{prefix}{connector}{star}{name}{desc}")
-            elif isinstance(val, dict):
-                lines.append(f"{prefix}{connector}{name}/")
-                _render(val, prefix + extension, depth + 1)
-
-    _render(tree)
-    return "\n".join(lines)
-
+        if entry.depth <= max_depth:
+            rows.append((entry.parts, entry))
+    if not rows:
+        return "", False
+
+    # Shared path depth between each row and the next one
+    common = [0] * len(rows)
+    for i in range(len(rows) - 1):
+        a, b = rows[i][0], rows[i + 1][0]
+        n = min(len(a), len(b))
+        k = 0
+        while k < n and a[k] == b[k]:
+            k += 1
+        common[i] = k
+
+    # Walking backwards, work out for each row which of its path components
+    # still have a later sibling (i.e. are not the last item in their folder)
+    has_sibling: list[list[bool]] = [[]] * len(rows)
+    current: list[bool] = []
+    for i in range(len(rows) - 1, -1, -1):
+        depth = len(rows[i][0])
+        if i == len(rows) - 1:
+            current = [False] * depth
+        else:
+            c = common[i]
+            current = current[:c] + [True] + [False] * (depth - c - 1)
+        has_sibling[i] = current
 
-def _format_api(apis: list[ModuleAPI]) -> str:
-    """Format public API index."""
     lines = []
+    prefixes = [""]
+    start = 0
+    total = -1  # no separator before the first line
+    for i, (parts, entry) in enumerate(rows):
+        if max_chars is not None and total >= max_chars:
+            return "\n".join(lines), True
+        siblings = has_sibling[i]
+        del prefixes[start + 1:]
+        for level in range(start, len(parts)):
+            connector = "├── " if siblings[level] else "└── "
+            prefix = prefixes[level]
+            if level == len(parts) - 1:
+                desc = f"  — {entry.description}" if entry.description else ""
+                star = "★ " if entry.is_entrypoint else ""
+                line = f"{prefix}{connector}{star}{parts[level]}{desc}"
+            else:
+                line = f"{prefix}{connector}{parts[level]}/"
+                prefixes.append(prefix + ("│   " if siblings[level] else "    "))
+            lines.append(line)
+            total += len(line) + 1
+        start = common[i]
+
+    return "\n".join(lines), False
+
+
+def _format_sig(func: FunctionSig, indent: str) -> str:
+    ret = f" → {func.returns}" if func.returns else ""
+    doc = f"  # {func.docstring}" if func.docstring else ""
+    return f"{indent}{'async def ' if func.is_async else 'def '}{func.name}({func.params}){ret}{doc}"
+
+
+def _format_api(apis: list[ModuleAPI], max_chars: int | None = None) -> tuple[str, bool]:
+    """Format public API index.
+
+    With ``max_chars``, stops adding modules once the text reaches that
+    length; the flag returned alongside the text says whether it did.
+    """
+    modules = []
+    total = -1  # no separator before the first module
     for api in apis:
+        if max_chars is not None and modules and total >= max_chars:
+            return "\n".join(modules), True
         if not api.functions and not api.classes:
             continue
 
-        lines.append(f"\n### {api.path}")
+        buf = [f"\n### {api.path}"]
         if api.docstring:
-            lines.append(f"*{api.docstring}*")
+            buf.append(f"*{api.docstring}*")
         if api.exports:
-            lines.append(f"Exports: {', '.join(api.exports)}")
+            buf.append(f"Exports: {', '.join(api.exports)}")
 
-        for func in api.functions:
-            async_prefix = "async " if func.is_async else ""
-            ret = f" → {func.returns}" if func.returns else ""
-            doc = f"  # {func.docstring}" if func.docstring else ""
-            lines.append(f"  {async_prefix}def {func.name}({func.params}){ret}{doc}")
+        buf.extend([_format_sig(func, "  ") for func in api.functions])
 
         for cls in api.classes:
             bases_str = f"({', '.join(cls.bases)})" if cls.bases else ""
             doc = f"  # {cls.docstring}" if cls.docstring else ""
-            lines.append(f"  class {cls.name}{bases_str}{doc}")
+            buf.append(f"  class {cls.name}{bases_str}{doc}")
             if cls.init_params:
-                lines.append(f"    __init__({cls.init_params})")
-            for method in cls.methods:
-                async_prefix = "async " if method.is_async else ""
-                ret = f" → {method.returns}" if method.returns else ""
-                mdoc = f"  # {method.docstring}" if method.docstring else ""
-                lines.append(f"    {async_prefix}def {method.name}({method.params}){ret}{mdoc}")
+                buf.append(f"    __init__({cls.init_params})")
+            buf.extend([_format_sig(method, "    ") for method in cls.methods])
 
-    return "\n".join(lines)
+        module_text = "\n".join(buf)
+        modules.append(module_text)
+        total += len(module_text) + 1
+
+    return "\n".join(modules), False
 
 
 def _format_deps(apis: list[ModuleAPI]) -> str:
     """Format import dependency summary."""
-    all_imports: dict[str, int] = defaultdict(int)
-    stdlib = {
-        "os", "sys", "re", "json", "csv", "ast", "math", "hashlib",
-        "pathlib", "datetime", "collections", "typing", "dataclasses",
-        "argparse", "textwrap", "subprocess", "unittest", "functools",
-        "itertools", "io", "abc", "enum", "copy", "shutil", "glob",
-        "tempfile", "logging", "warnings", "http", "urllib", "socket",
-        "ssl", "email", "html", "xml", "sqlite3", "threading",
-        "multiprocessing", "asyncio", "concurrent", "contextlib",
-        "inspect", "dis", "importlib", "pkgutil", "struct", "time",
-    }
-
+    all_imports: Counter[str] = Counter()
     for api in apis:
-        for imp in api.imports:
-            if imp not in stdlib:
-                all_imports[imp] += 1
+        all_imports.update(imp for imp in api.imports if imp not in _STDLIB_MODULES)
 
     if not all_imports:
         return "No third-party dependencies detected."
 
-    sorted_deps = sorted(all_imports.items(), key=lambda x: -x[1])
     lines = []
-    for dep, count in sorted_deps:
+    for dep, count in all_imports.most_common():
         lines.append(f"  {dep} (used by {count} module{'s' if count > 1 else ''})")
     return "\n".join(lines)
 
@@ -562,7 +1100,9 @@ def _format_deps(apis: list[ModuleAPI]) -> str:
 def generate_map(root: str, max_depth: int = 10,
                   include_private: bool = False,
                   token_budget: int | None = None,
-                  exclude_tests: bool = False) -> str:
+                  exclude_tests: bool = False,
+                  use_cache: bool = False,
+                  jobs: int | None = None) -> str:
     """Generate the complete codebase map."""
     entries = discover_files(root, max_depth=max_depth, exclude_tests=exclude_tests)
     if not entries:
@@ -574,13 +1114,9 @@ def generate_map(root: str, max_depth: int = 10,
     entries.sort(key=lambda e: -e.importance)
 
     # Extract Python APIs
-    apis: list[ModuleAPI] = []
-    for entry in entries:
-        if entry.rel_path.endswith('.py'):
-            api = extract_python_api(entry.path, include_private=include_private)
-            if api and (api.functions or api.classes):
-                api.path = entry.rel_path
-                apis.append(api)
+    cache_path = _api_cache_path(root) if use_cache else None
+    apis = _extract_apis(entries, include_private=include_private,
+                         cache_path=cache_path, jobs=jobs)
 
     # Project metadata
     project_name = os.path.basename(os.path.abspath(root))
@@ -600,14 +1136,27 @@ def generate_map(root: str, max_depth: int = 10,
         sections.append(f"Entrypoints: {', '.join(entrypoints)}")
     sections.append("")
 
+    # With a budget, stop formatting the tree and the API once the text
+    # would be cut off anyway (apis are already in importance order)
+    budget_chars = token_budget * CHARS_PER_TOKEN if token_budget else None
+
     # File tree
     sections.append("## Structure\n")
     sections.append("```")
-    sections.append(_format_tree(entries, max_depth=max_depth))
+    tree_budget = None
+    if budget_chars is not None:
+        tree_budget = budget_chars - sum(len(s) + 1 for s in sections)
+    tree_text, tree_truncated = _format_tree(entries, max_depth=max_depth,
+                                             max_chars=tree_budget)
+    sections.append(tree_text)
     sections.append("```\n")
 
     # Public API
-    api_text = _format_api(apis)
+    api_budget = None
+    if budget_chars is not None:
+        api_start = sum(len(s) + 1 for s in sections) + len("## Public API\n\n```python\n")
+        api_budget = budget_chars - api_start
+    api_text, api_truncated = _format_api(apis, max_chars=api_budget)
     if api_text.strip():
         sections.append("## Public API\n")
         sections.append("```python")
@@ -621,8 +1170,8 @@ def generate_map(root: str, max_depth: int = 10,
         sections.append(deps_text)
         sections.append("")
 
-    # Hot files (top 10 most important)
-    hot = sorted(entries, key=lambda e: -e.importance)[:10]
+    # Hot files (top 10 most important; entries are already in that order)
+    hot = entries[:10]
     if hot:
         sections.append("## Key Files\n")
         for h in hot:
@@ -634,41 +1183,30 @@ def generate_map(root: str, max_depth: int = 10,
     output = "\n".join(sections)
 
     # Token budget trimming
-    if token_budget:
+    if budget_chars is not None:
         est_tokens = len(output) // CHARS_PER_TOKEN
-        if est_tokens > token_budget:
-            # Trim API section first (largest)
-            for i, section in enumerate(sections):
-                if section.startswith("## Public API"):
-                    # Truncate at budget
-                    budget_chars = token_budget * CHARS_PER_TOKEN
-                    output = "\n".join(sections)
-                    if len(output) > budget_chars:
-                        output = output[:budget_chars] + "\n\n... (truncated to fit token budget)"
-                    break
+        if ((tree_truncated or api_truncated or est_tokens > token_budget)
+                and len(output) > budget_chars):
+            output = output[:budget_chars] + "\n\n... (truncated to fit token budget)"
 
     return output
 
 
-def generate_json(root: str, max_depth: int = 10,
-                   include_private: bool = False,
-                   exclude_tests: bool = False) -> str:
-    """Generate JSON output."""
+def _json_payload(root: str, max_depth: int, include_private: bool,
+                  exclude_tests: bool, use_cache: bool,
+                  jobs: int | None) -> dict[str, Any]:
+    """Build the JSON document for ``root`` as plain dicts and lists."""
     entries = discover_files(root, max_depth=max_depth, exclude_tests=exclude_tests)
     _score_importance(entries, root)
     entries.sort(key=lambda e: -e.importance)
 
-    apis: list[ModuleAPI] = []
-    for entry in entries:
-        if entry.rel_path.endswith('.py'):
-            api = extract_python_api(entry.path, include_private=include_private)
-            if api:
-                api.path = entry.rel_path
-                apis.append(api)
+    cache_path = _api_cache_path(root) if use_cache else None
+    apis = _extract_apis(entries, include_private=include_private,
+                         cache_path=cache_path, jobs=jobs)
 
     project_name = os.path.basename(os.path.abspath(root))
 
-    return json.dumps({
+    return {
         "project": project_name,
         "files": len(entries),
         "total_lines": sum(e.lines for e in entries),
@@ -721,14 +1259,62 @@ def generate_json(root: str, max_depth: int = 10,
                     for c in a.classes
                 ],
             }
-            for a in apis if a.functions or a.classes
+            for a in apis
         ],
-    }, indent=2)
+    }
+
+
+def write_json(out: Any, root: str, max_depth: int = 10,
+               include_private: bool = False,
+               exclude_tests: bool = False,
+               use_cache: bool = False,
+               compact: bool = False,
+               jobs: int | None = None) -> None:
+    """Write JSON output to the text stream ``out``.
+
+    Indented output is streamed chunk by chunk, so the full document is
+    never held as one string. ``compact`` drops indentation, which lets the
+    stdlib use its one-shot C encoder instead of the pure-Python one.
+    """
+    payload = _json_payload(root, max_depth, include_private,
+                            exclude_tests, use_cache, jobs)
+    if compact:
+        out.write(json.dumps(payload, separators=(",", ":")))
+        return
+    write = out.write
+    for chunk in json.JSONEncoder(indent=2).iterencode(payload):
+        write(chunk)
+
+
+def generate_json(root: str, max_depth: int = 10,
+                  include_private: bool = False,
+                  exclude_tests: bool = False,
+                  use_cache: bool = False,
+                  compact: bool = False,
+                  jobs: int | None = None) -> str:
+    """Generate JSON output as a string. See :func:`write_json`."""
+    buf = io.StringIO()
+    write_json(buf, root, max_depth=max_depth,
+               include_private=include_private,
+               exclude_tests=exclude_tests, use_cache=use_cache,
+               compact=compact, jobs=jobs)
+    return buf.getvalue()
 
 
 # ── Main ─────────────────────────────────────────────────────────────────────
 
-def main(argv: list[str] | None = None) -> int:
+def _positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: {value!r}")
+    return number
+
+
+def main(argv: list[str] | None = None, stdout: Any = None) -> int:
+    """Run the CLI, writing the map to ``stdout`` (default: sys.stdout)."""
     parser = argparse.ArgumentParser(
         prog="codemap",
         description="Intelligent Codebase Map for AI Agents",
@@ -745,12 +1331,16 @@ def main(argv: list[str] | None = None) -> int:
               codemap --depth 3              Limit tree depth
               codemap --include-private      Include _private functions
               codemap --token-budget 4000    Fit within token limit
+              codemap --no-cache             Re-parse everything (skip the API cache)
+              codemap --jobs 1               Parse in a single process
         """),
     )
     parser.add_argument("path", nargs="?", default=".",
                         help="Project path (default: current directory)")
     parser.add_argument("--format", choices=["markdown", "json"], default="markdown",
                         help="Output format (default: markdown)")
+    parser.add_argument("--compact", action="store_true",
+                        help="Emit JSON without indentation (faster, smaller)")
     parser.add_argument("--depth", type=int, default=10,
                         help="Maximum directory depth (default: 10)")
     parser.add_argument("--include-private", action="store_true",
@@ -759,6 +1349,11 @@ def main(argv: list[str] | None = None) -> int:
                         help="Exclude test files from output (test_*, *_test.py, tests/, etc.)")
     parser.add_argument("--token-budget", type=int, default=None,
                         help="Target token budget (output truncated to fit)")
+    parser.add_argument("--jobs", "-j", type=_positive_int, default=None,
+                        help="Worker processes for parsing Python files "
+                             "(default: CPU count; 1 disables parallelism)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Re-parse every Python file instead of reusing cached APIs")
     parser.add_argument("--version", action="version", version="codemap 1.0.0")
 
     args = parser.parse_args(argv)
@@ -768,15 +1363,23 @@ def main(argv: list[str] | None = None) -> int:
         print(f"Error: {args.path} is not a directory", file=sys.stderr)
         return 1
 
+    out = stdout if stdout is not None else sys.stdout
     if args.format == "json":
-        print(generate_json(root, max_depth=args.depth,
-                             include_private=args.include_private,
-                             exclude_tests=args.exclude_tests))
+        write_json(out, root, max_depth=args.depth,
+                   include_private=args.include_private,
+                   exclude_tests=args.exclude_tests,
+                   use_cache=not args.no_cache,
+                   compact=args.compact,
+                   jobs=args.jobs)
+        out.write("\n")
     else:
-        print(generate_map(root, max_depth=args.depth,
-                            include_private=args.include_private,
-                            token_budget=args.token_budget,
-                            exclude_tests=args.exclude_tests))
+        out.write(generate_map(root, max_depth=args.depth,
+                               include_private=args.include_private,
+                               token_budget=args.token_budget,
+                               exclude_tests=args.exclude_tests,
+                               use_cache=not args.no_cache,
+                               jobs=args.jobs))
+        out.write("\n")
 
     return 0
 
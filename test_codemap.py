@@ -11,12 +11,15 @@ Tests cover:
 - Edge cases
 """
 
+import ast
 import unittest
 import sys
 import os
 import json
 import tempfile
+import threading
 import shutil
+import subprocess
 from pathlib import Path
 from unittest.mock import patch
 from io import StringIO
@@ -92,6 +95,68 @@ class TestFileDiscovery(unittest.TestCase):
         too_deep = os.path.join("a", "b", "c", "d", "deep.py")
         self.assertNotIn(too_deep, paths)
 
+    def test_exclude_tests(self):
+        """Test that test files and test directories are excluded on request."""
+        Path(self.test_dir, "test_main.py").write_text("# Test")
+        Path(self.test_dir, "widget.spec.ts").write_text("// Spec")
+        Path(self.test_dir, "tests").mkdir()
+        Path(self.test_dir, "tests", "helpers.py").write_text("# Helpers")
+
+        entries = codemap.discover_files(self.test_dir, exclude_tests=True)
+        paths = [e.rel_path for e in entries]
+
+        self.assertIn("main.py", paths)
+        self.assertNotIn("test_main.py", paths)
+        self.assertNotIn("widget.spec.ts", paths)
+        self.assertNotIn(os.path.join("tests", "helpers.py"), paths)
+
+    def test_line_counts(self):
+        """Test line counting with and without a trailing newline."""
+        Path(self.test_dir, "two.py").write_text("a = 1\nb = 2\n")
+        Path(self.test_dir, "partial.py").write_text("a = 1\nb = 2")
+        Path(self.test_dir, "empty.py").write_text("")
+
+        entries = {e.rel_path: e for e in codemap.discover_files(self.test_dir)}
+
+        self.assertEqual(entries["two.py"].lines, 2)
+        self.assertEqual(entries["partial.py"].lines, 2)
+        self.assertEqual(entries["empty.py"].lines, 0)
+
+    @unittest.skipUnless(shutil.which("git"), "git not available")
+    def test_git_repo_honours_gitignore(self):
+        """Test that files git ignores are skipped and the usual filters still apply."""
+        subprocess.run(["git", "init"], cwd=self.test_dir, check=True, capture_output=True)
+        Path(self.test_dir, ".gitignore").write_text("generated/\n*.log\n")
+        Path(self.test_dir, "generated").mkdir()
+        Path(self.test_dir, "generated", "out.py").write_text("# Generated")
+        Path(self.test_dir, "debug.log").write_text("noise")
+
+        entries = codemap.discover_files(self.test_dir)
+        paths = [e.rel_path for e in entries]
+
+        self.assertIn("main.py", paths)  # untracked but not ignored
+        self.assertIn(os.path.join("subdir", "module.py"), paths)
+        self.assertNotIn(os.path.join("generated", "out.py"), paths)
+        self.assertNotIn("debug.log", paths)
+        self.assertNotIn(".hidden.py", paths)
+        self.assertNotIn(".gitignore", paths)
+        self.assertFalse(any("__pycache__" in p for p in paths))
+
+    @unittest.skipUnless(shutil.which("git"), "git not available")
+    def test_git_ignored_root_falls_back_to_walk(self):
+        """Test that a project ignored by an enclosing repo is still walked."""
+        with tempfile.TemporaryDirectory() as parent:
+            subprocess.run(["git", "init"], cwd=parent, check=True, capture_output=True)
+            Path(parent, ".gitignore").write_text("*\n!.gitignore\n")
+            project = Path(parent, "project")
+            shutil.copytree(self.test_dir, project)
+
+            paths = [e.rel_path for e in codemap.discover_files(str(project))]
+
+        self.assertIn("main.py", paths)
+        self.assertIn(os.path.join("subdir", "module.py"), paths)
+        self.assertNotIn(".hidden.py", paths)
+
 
 class TestLanguageDetection(unittest.TestCase):
     """Test language detection."""
@@ -144,11 +209,22 @@ if __name__ == '__main__':
 """
         self.assertTrue(codemap._is_entrypoint("script.py", content))
 
+    def test_detect_main_block_bytes(self):
+        """Test that raw file bytes can be checked without decoding."""
+        content = b"if __name__ == '__main__':\n    main()\n"
+        self.assertTrue(codemap._is_entrypoint("script.py", content))
+        self.assertFalse(codemap._is_entrypoint("utils.py", b"def helper(): pass"))
+
     def test_not_entrypoint(self):
         """Test that regular files are not flagged as entrypoints."""
         self.assertFalse(codemap._is_entrypoint("helper.py"))
         self.assertFalse(codemap._is_entrypoint("utils.py", "def helper(): pass"))
 
+    def test_main_mentioned_without_guard(self):
+        """Test that mentioning __name__ and __main__ is not enough."""
+        content = "log(__name__)\nmain = sys.modules['__main__']\n"
+        self.assertFalse(codemap._is_entrypoint("utils.py", content))
+
 
 class TestDescriptionExtraction(unittest.TestCase):
     """Test description extraction from files."""
@@ -184,6 +260,19 @@ class TestDescriptionExtraction(unittest.TestCase):
         desc = codemap._get_description(str(test_file))
         self.assertLessEqual(len(desc), 120)
 
+    def test_description_from_content(self):
+        """Test that already-read content is used instead of the file."""
+        content = '#!/usr/bin/env python3\n"""\nMulti-line docstring.\n"""\n'
+        desc = codemap._get_description("missing.py", content)
+        self.assertEqual(desc, "Multi-line docstring.")
+
+    def test_description_from_large_file(self):
+        """Test descriptions of large files, including ones past the decoded prefix."""
+        body = "x = 1\n" * 2000
+        self.assertEqual(codemap._description_from_bytes(f"# Setup\n{body}".encode()), "Setup")
+        late = "\n" * 5000 + "# Late header\n" + body
+        self.assertEqual(codemap._description_from_bytes(late.encode()), "Late header")
+
 
 class TestPythonAPIExtraction(unittest.TestCase):
     """Test Python API extraction."""
@@ -228,6 +317,28 @@ async def async_func(name: str):
         self.assertEqual(len(api.functions), 1)
         self.assertTrue(api.functions[0].is_async)
 
+    def test_params_keep_source_spelling(self):
+        """Test that annotations and defaults are rendered as written."""
+        test_file = Path(self.test_dir, "test.py")
+        test_file.write_text(
+            "def f(mode=0o666, label: \"Café\" = 'é', opts: dict[str, 'Opt'] = {\n"
+            "        'a': 1}) -> \"Result\":\n"
+            "    pass\n", encoding="utf-8")
+
+        api = codemap.extract_python_api(str(test_file))
+        self.assertEqual(api.functions[0].params,
+                         "mode = 0o666, label: \"Café\" = 'é', "
+                         "opts: dict[str, 'Opt'] = {'a': 1}")
+        self.assertEqual(api.functions[0].returns, '"Result"')
+
+    def test_unparse_matches_ast_unparse(self):
+        """Test that the annotation fast path renders like ast.unparse."""
+        for expr in ["int", "os.PathLike", "list[FileEntry]", "dict[str, Any] | None",
+                     "Tuple[int, ...]", "x[1,]", "Literal['a', None, True, 3]",
+                     "A | (B | C)", "u'x'", "'it\\'s'", "-1", "f(x)[0]", "x[()]"]:
+            node = ast.parse(expr, mode="eval").body
+            self.assertEqual(codemap._unparse(node), ast.unparse(node), expr)
+
     def test_extract_classes(self):
         """Test extracting class signatures."""
         test_file = Path(self.test_dir, "test.py")
@@ -311,6 +422,13 @@ def private_func():
         self.assertIsNotNone(api)
         self.assertEqual(api.exports, ['public_func', 'PublicClass'])
 
+    def test_extract_from_source(self):
+        """Test extracting API from source that is already in memory."""
+        api = codemap.extract_python_api_from_source(
+            "def run(n: int) -> None:\n    pass\n", "missing.py")
+        self.assertIsNotNone(api)
+        self.assertEqual(api.functions[0].name, "run")
+
     def test_handle_syntax_error(self):
         """Test handling files with syntax errors."""
         test_file = Path(self.test_dir, "test.py")
@@ -350,6 +468,38 @@ class TestImportanceScoring(unittest.TestCase):
         json_score = next(e.importance for e in entries if e.rel_path == "config.json")
         self.assertGreater(py_score, json_score)
 
+    @unittest.skipUnless(shutil.which("git"), "git not available")
+    def test_git_churn(self):
+        """Test counting recent commits per file from git history."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            def git(*args):
+                subprocess.run(["git", "-c", "user.name=t", "-c", "user.email=t@t", *args],
+                               cwd=tmpdir, check=True, capture_output=True)
+
+            git("init")
+            Path(tmpdir, "a.py").write_text("a = 1\n")
+            Path(tmpdir, "b.py").write_text("b = 1\n")
+            git("add", ".")
+            git("commit", "-m", "one")
+            Path(tmpdir, "a.py").write_text("a = 2\n")
+            git("commit", "-am", "two")
+
+            churn = codemap._git_churn(tmpdir)
+
+        self.assertEqual(churn["a.py"], 2)
+        self.assertEqual(churn["b.py"], 1)
+
+    def test_git_churn_leaves_no_threads(self):
+        """Test that the churn timeout timer is gone once churn returns."""
+        before = threading.active_count()
+        codemap._git_churn(os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(threading.active_count(), before)
+
+    def test_git_churn_outside_repo(self):
+        """Test that churn is empty outside a git repository."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.assertEqual(codemap._git_churn(tmpdir), {})
+
     def test_empty_entries(self):
         """Test scoring with empty entries list."""
         # Should not crash
@@ -385,6 +535,36 @@ class TestOutputFormatting(unittest.TestCase):
         self.assertIn("file_tree", data)
         self.assertIsInstance(data["file_tree"], list)
 
+    def test_write_json_matches_generate_json(self):
+        """Test that streamed JSON matches the string returned by generate_json."""
+        for compact in (False, True):
+            buf = StringIO()
+            codemap.write_json(buf, self.test_dir, compact=compact)
+            self.assertEqual(buf.getvalue(),
+                             codemap.generate_json(self.test_dir, compact=compact))
+
+    def test_json_api_with_cr_line_endings(self):
+        """Test that files using bare \\r line endings still get their API listed."""
+        Path(self.test_dir, "mac.py").write_bytes(
+            b'"""Doc."""\rimport os\rdef g(a: int) -> int: ...\rclass K: pass\r')
+
+        data = json.loads(codemap.generate_json(self.test_dir))
+        api = {a["module"]: a for a in data["api"]}
+
+        self.assertEqual([f["name"] for f in api["mac.py"]["functions"]], ["g"])
+        self.assertEqual([c["name"] for c in api["mac.py"]["classes"]], ["K"])
+
+    def test_json_api_skips_modules_without_definitions(self):
+        """Test that modules with no functions or classes are left out of the API."""
+        Path(self.test_dir, "consts.py").write_text("import os\nVALUE = 1\n")
+        Path(self.test_dir, "funcs.py").write_text("def run():\n    pass\n")
+
+        data = json.loads(codemap.generate_json(self.test_dir))
+        modules = [a["module"] for a in data["api"]]
+
+        self.assertIn("funcs.py", modules)
+        self.assertNotIn("consts.py", modules)
+
     def test_tree_format(self):
         """Test file tree formatting."""
         entries = [
@@ -392,12 +572,51 @@ class TestOutputFormatting(unittest.TestCase):
             codemap.FileEntry("subdir/module.py", os.path.join("subdir", "module.py"), 50, 5),
         ]
         
-        tree = codemap._format_tree(entries)
+        tree, truncated = codemap._format_tree(entries)
         
+        self.assertFalse(truncated)
         self.assertIn("main.py", tree)
         self.assertIn("subdir/", tree)
         self.assertIn("Main file", tree)
 
+    def test_api_format_stops_at_budget(self):
+        """Test that API formatting stops adding modules past the budget."""
+        apis = [
+            codemap.ModuleAPI(path=f"mod{i}.py",
+                              functions=[codemap.FunctionSig(f"func{i}", "", "", "")])
+            for i in range(10)
+        ]
+
+        full, truncated = codemap._format_api(apis)
+        self.assertFalse(truncated)
+        self.assertIn("mod9.py", full)
+
+        partial, truncated = codemap._format_api(apis, max_chars=40)
+        self.assertTrue(truncated)
+        self.assertIn("mod0.py", partial)
+        self.assertNotIn("mod9.py", partial)
+
+    def test_tree_format_stops_at_budget(self):
+        """Test that tree formatting stops adding lines past the budget."""
+        entries = [codemap.FileEntry(f"file{i}.py", f"file{i}.py", 10, 1) for i in range(10)]
+
+        full, _ = codemap._format_tree(entries)
+        partial, truncated = codemap._format_tree(entries, max_chars=20)
+        self.assertTrue(truncated)
+        self.assertTrue(full.startswith(partial))
+        self.assertGreaterEqual(len(partial), 20)
+        self.assertNotIn("file9.py", partial)
+
+    def test_token_budget_truncates_tree_only_projects(self):
+        """Test that the budget applies even when there is no Python API."""
+        for i in range(200):
+            Path(self.test_dir, f"script{i}.sh").write_text(f"# Script {i}\n")
+
+        output = codemap.generate_map(self.test_dir, token_budget=200)
+
+        self.assertIn("truncated to fit token budget", output)
+        self.assertLess(len(output), 200 * codemap.CHARS_PER_TOKEN * 1.5)
+
     def test_token_budget_truncation(self):
         """Test output truncation with token budget."""
         # Create a project with lots of content
@@ -413,29 +632,47 @@ class TestOutputFormatting(unittest.TestCase):
 class TestCLI(unittest.TestCase):
     """Test CLI functionality."""
 
+    def setUp(self):
+        # Keep the API cache out of the real user cache directory
+        self.cache_dir = tempfile.mkdtemp()
+        env = patch.dict(os.environ, {"XDG_CACHE_HOME": self.cache_dir})
+        env.start()
+        self.addCleanup(env.stop)
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
     def test_default_path(self):
         """Test that default path is current directory."""
-        with patch('sys.stdout', new=StringIO()):
-            exit_code = codemap.main([])
+        exit_code = codemap.main([], stdout=StringIO())
         self.assertEqual(exit_code, 0)
 
     def test_json_format(self):
         """Test JSON output format via CLI."""
         with tempfile.TemporaryDirectory() as tmpdir:
-            with patch('sys.stdout', new=StringIO()) as fake_out:
-                exit_code = codemap.main([tmpdir, "--format", "json"])
-                output = fake_out.getvalue()
-                
+            out = StringIO()
+            exit_code = codemap.main([tmpdir, "--format", "json"], stdout=out)
+            output = out.getvalue()
+
             self.assertEqual(exit_code, 0)
             # Should be valid JSON
             data = json.loads(output)
             self.assertIn("project", data)
 
+    def test_compact_json(self):
+        """Test unindented JSON output via CLI."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            Path(tmpdir, "main.py").write_text("def run():\n    pass\n")
+            out = StringIO()
+            exit_code = codemap.main([tmpdir, "--format", "json", "--compact"], stdout=out)
+            output = out.getvalue()
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(output.count("\n"), 1)
+        self.assertEqual(json.loads(output)["files"], 1)
+
     def test_depth_argument(self):
         """Test depth argument."""
         with tempfile.TemporaryDirectory() as tmpdir:
-            with patch('sys.stdout', new=StringIO()):
-                exit_code = codemap.main([tmpdir, "--depth", "3"])
+            exit_code = codemap.main([tmpdir, "--depth", "3"], stdout=StringIO())
             self.assertEqual(exit_code, 0)
 
     def test_include_private(self):
@@ -443,18 +680,17 @@ class TestCLI(unittest.TestCase):
         with tempfile.TemporaryDirectory() as tmpdir:
             Path(tmpdir, "test.py").write_text("def _private(): pass")
             
-            with patch('sys.stdout', new=StringIO()) as fake_out:
-                exit_code = codemap.main([tmpdir, "--include-private"])
-                output = fake_out.getvalue()
-            
+            out = StringIO()
+            exit_code = codemap.main([tmpdir, "--include-private"], stdout=out)
+            output = out.getvalue()
+
             self.assertEqual(exit_code, 0)
             self.assertIn("_private", output)
 
     def test_token_budget_cli(self):
         """Test token budget CLI argument."""
         with tempfile.TemporaryDirectory() as tmpdir:
-            with patch('sys.stdout', new=StringIO()):
-                exit_code = codemap.main([tmpdir, "--token-budget", "1000"])
+            exit_code = codemap.main([tmpdir, "--token-budget", "1000"], stdout=StringIO())
             self.assertEqual(exit_code, 0)
 
     def test_invalid_path(self):
@@ -464,6 +700,14 @@ class TestCLI(unittest.TestCase):
             
         self.assertEqual(exit_code, 1)
 
+    def test_jobs_must_be_positive(self):
+        """Test that --jobs rejects zero and negative worker counts."""
+        for value in ("0", "-2", "many"):
+            with patch('sys.stderr', new=StringIO()):
+                with self.assertRaises(SystemExit) as cm:
+                    codemap.main([".", "--jobs", value], stdout=StringIO())
+            self.assertEqual(cm.exception.code, 2)
+
     def test_version(self):
         """Test --version flag."""
         with self.assertRaises(SystemExit) as cm:
@@ -471,6 +715,148 @@ class TestCLI(unittest.TestCase):
         self.assertEqual(cm.exception.code, 0)
 
 
+class TestAPICache(unittest.TestCase):
+    """Test reuse of parsed APIs across runs."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(tempfile.mkdtemp(), "cache.json")
+        self.module = Path(self.test_dir, "mod.py")
+        self.module.write_text("def first():\n    pass\n")
+
+    def tearDown(self):
+        codemap._clear_caches()
+        shutil.rmtree(self.test_dir)
+        shutil.rmtree(os.path.dirname(self.cache_path))
+
+    def _apis(self):
+        entries = codemap.discover_files(self.test_dir)
+        return codemap._extract_apis(entries, cache_path=self.cache_path)
+
+    def test_repeat_calls_reuse_parsed_modules(self):
+        """Test that a second cached run in the same process doesn't re-parse."""
+        self._apis()
+        os.remove(self.cache_path)  # only the in-process memo remains
+
+        with patch.object(codemap, "_extract_one", side_effect=AssertionError("re-parsed")):
+            apis = self._apis()
+        self.assertEqual(apis[0].functions[0].name, "first")
+
+    def test_uncached_runs_always_reparse(self):
+        """Test that without a cache an edit keeping size and mtime is still seen."""
+        self.module.write_text("def aaa():\n    pass\n")
+        st = self.module.stat()
+        self.assertEqual(codemap._extract_apis(codemap.discover_files(self.test_dir))[0]
+                         .functions[0].name, "aaa")
+
+        self.module.write_text("def bbb():\n    pass\n")
+        os.utime(self.module, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        apis = codemap._extract_apis(codemap.discover_files(self.test_dir))
+        self.assertEqual(apis[0].functions[0].name, "bbb")
+
+    def test_unchanged_file_uses_cache(self):
+        """Test that unchanged files are not parsed again."""
+        self.assertEqual(self._apis()[0].functions[0].name, "first")
+        codemap._clear_caches()  # only the on-disk cache remains
+
+        with patch.object(codemap, "_extract_one", side_effect=AssertionError("re-parsed")):
+            apis = self._apis()
+        self.assertEqual(apis[0].path, "mod.py")
+        self.assertEqual(apis[0].functions[0].name, "first")
+
+    def test_changed_file_is_reparsed(self):
+        """Test that a modified file invalidates its cache entry."""
+        self._apis()
+        self.module.write_text("def second_version():\n    pass\n")
+
+        apis = self._apis()
+        self.assertEqual(apis[0].functions[0].name, "second_version")
+
+    def test_cache_keeps_both_include_private_variants(self):
+        """Test that toggling include_private doesn't evict the other variant."""
+        entries = codemap.discover_files(self.test_dir)
+        codemap._extract_apis(entries, cache_path=self.cache_path)
+        codemap._extract_apis(entries, include_private=True, cache_path=self.cache_path)
+        codemap._clear_caches()
+
+        with patch.object(codemap, "_extract_one", side_effect=AssertionError("re-parsed")):
+            codemap._extract_apis(entries, cache_path=self.cache_path)
+            codemap._extract_apis(entries, include_private=True, cache_path=self.cache_path)
+
+    def test_cache_drops_deleted_files(self):
+        """Test that files that no longer exist are removed from the cache."""
+        Path(self.test_dir, "gone.py").write_text("def gone():\n    pass\n")
+        self._apis()
+        os.remove(Path(self.test_dir, "gone.py"))
+        self._apis()
+
+        cached = codemap._load_api_cache(self.cache_path)
+        self.assertFalse(any(key.endswith("gone.py") for key in cached))
+
+    def test_entries_without_mtime_bypass_cache(self):
+        """Test that entries lacking an mtime are always parsed and never cached."""
+        def entries():
+            return [codemap.FileEntry(str(self.module), "mod.py", self.module.stat().st_size)]
+
+        codemap._extract_apis(entries(), cache_path=self.cache_path)
+        self.module.write_text("def secnd():\n    pass\n")  # same size
+
+        apis = codemap._extract_apis(entries(), cache_path=self.cache_path)
+        self.assertEqual(apis[0].functions[0].name, "secnd")
+        self.assertEqual(codemap._load_api_cache(self.cache_path), {})
+
+    def test_corrupt_cache_is_ignored(self):
+        """Test that an unreadable cache file is treated as empty."""
+        Path(self.cache_path).write_text("not json")
+        self.assertEqual(self._apis()[0].functions[0].name, "first")
+
+
+class TestParallelExtraction(unittest.TestCase):
+    """Test parsing Python files across worker processes."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        # Enough files for two workers
+        self.count = 2 * codemap._MIN_FILES_PER_WORKER
+        for i in range(self.count):
+            Path(self.test_dir, f"mod{i:03d}.py").write_text(f"def func{i}():\n    pass\n")
+
+    def tearDown(self):
+        codemap._clear_caches()
+        shutil.rmtree(self.test_dir)
+
+    def test_parallel_matches_serial(self):
+        """Test that worker processes produce the same APIs in the same order."""
+        entries = codemap.discover_files(self.test_dir)
+
+        serial = codemap._extract_apis(entries, jobs=1)
+        codemap._clear_caches()
+        parallel = codemap._extract_apis(entries, jobs=2)
+
+        self.assertEqual(len(parallel), self.count)
+        self.assertEqual(parallel, serial)
+
+    def test_windows_worker_limit(self):
+        """Test that the worker count is clamped to what Windows allows."""
+        entries = codemap.discover_files(self.test_dir) * 64
+        with patch.object(codemap.sys, "platform", "win32"), \
+                patch.object(codemap, "ProcessPoolExecutor",
+                             side_effect=OSError("no pool")) as pool:
+            codemap._extract_apis(entries, jobs=100)
+        self.assertEqual(pool.call_args.kwargs["max_workers"],
+                         codemap._MAX_WINDOWS_WORKERS)
+
+    def test_small_runs_stay_serial(self):
+        """Test that no pool is started when too few files need parsing."""
+        entries = codemap.discover_files(self.test_dir)[:codemap._MIN_FILES_PER_WORKER + 1]
+
+        with patch.object(codemap, "ProcessPoolExecutor",
+                          side_effect=AssertionError("pool started")):
+            apis = codemap._extract_apis(entries, jobs=8)
+        self.assertEqual(len(apis), len(entries))
+
+
 class TestEdgeCases(unittest.TestCase):
     """Test edge cases and error handling."""
 